@@ -1,11 +1,23 @@
-from fastapi import FastAPI, HTTPException   # For error handling
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Path   # For error handling and dependencies
 import asyncpg   # For PostgreDQL connection
-import json  # To handle JSON data
-from pydantic import BaseModel # Import Pydantic for data validation
-from typing import List, Optional
+import asyncio  # To run coroutines together
+from contextlib import asynccontextmanager
+import anyio.to_thread  # To size the threadpool used for sync code
+import orjson  # Fast JSON encoding/decoding
+import logging  # Logging instead of print
+import logging.handlers
+import queue
+import atexit  # To flush the log queue when the process exits
+import secrets  # To compare the admin token safely
+from pydantic import BaseModel, Field # Import Pydantic for data validation
+from typing import Annotated, Any, Dict, Optional
 import os   # os for environment var
 from dotenv import load_dotenv  # To load .env files 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse  # Faster JSON responses, handles datetime natively
+from fastapi_cache import FastAPICache  # In-memory cache for catalog data
+from fastapi_cache.backends.inmemory import InMemoryBackend, Value
+from fastapi_cache.decorator import cache
 
 
 
@@ -13,11 +25,29 @@ from fastapi.middleware.cors import CORSMiddleware
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="DegreePath API", version="1.0.0")  #Handle all web request
+# orjson doesn't know asyncpg rows, turn them into dicts while serializing
+def _orjson_default(obj):
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class RecordJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse that can serialize asyncpg Record objects directly.
+    Endpoints return it explicitly so FastAPI skips its own jsonable_encoder copy of every row.
+    Don't return it from @cache endpoints, the cache sets its headers on the response FastAPI builds
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+app = FastAPI(title="DegreePath API", version="1.0.0", default_response_class=RecordJSONResponse)  #Handle all web request
+
+# Frontend origins allowed to call the API, comma separated (defaults to the Vite dev server)
+CORS_ORIGINS = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",") if origin.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # CHANGE DOMAIN!!
+    allow_origins=CORS_ORIGINS,  # Explicit list instead of "*", no wildcard handling per request
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -29,6 +59,14 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")                    
 DB_PASSWORD = os.getenv("DB_PASSWORD") 
 
+# Running behind PgBouncer (pool_mode=transaction), e.g. DB_PORT=6432
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+# Total Postgres connections this API may use, split between all uvicorn workers
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "50"))
+# Number of uvicorn worker processes (uvicorn reads the same variable for --workers).
+# Set this rather than passing --workers, otherwise every worker sizes its pool as if it were alone
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
 # Build database URL from individual components
 if DB_USER and DB_PASSWORD:
     DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
@@ -37,10 +75,29 @@ else:
     DATABASE_URL = os.getenv("DATABASE_URL")
     if not DATABASE_URL:
         raise ValueError("Database credentials not found! Please set DB_USER and DB_PASSWORD in .env file")
-print(f"Connecting to database: {DB_HOST}:{DB_PORT}/{DB_NAME} as {DB_USER}")
+
+# Log records go onto a queue and a background thread writes them out,
+# so logging never blocks the event loop on stdout
+logger = logging.getLogger(__name__)
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+
+# Set up once per process (not per app startup), so restarting the app doesn't add another handler
+if not any(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers):
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # Flush whatever is left in the log queue on exit
 
 # Pydantic Models - These define the structure of data coming in/out of our API
 
+# Range a PostgreSQL INTEGER id column can hold
+INT4_MIN = -2**31
+INT4_MAX = 2**31 - 1
+
 class CreateUser(BaseModel):
     """
     Model for creating a new user
@@ -50,107 +107,253 @@ class CreateUser(BaseModel):
     email: str  # Required string field
     name: str   # Required string field
 
-class User(BaseModel):
-    """
-    Model for user data coming out of database
-    """
-    id: int
-    email: str
-    name: str
-
 class CreatePlan(BaseModel):
     """
     Model for creating a degree plan
     """
-    program_id: int           # Which program this plan is for
-    plan_data: dict          # The actual plan data (flexible JSON)
+    program_id: int = Field(ge=INT4_MIN, le=INT4_MAX)  # Which program this plan is for
+    plan_data: Dict[str, Any]  # The actual plan data (flexible JSON object), values aren't validated one by one
+
+# Hot read-only queries, kept as constants so every call sends the exact same text
+# and hits the prepared statement asyncpg caches on each connection
+SCHOOLS_QUERY = "SELECT DISTINCT school_name FROM programs ORDER BY school_name"
+PROGRAMS_FOR_SCHOOL_QUERY = """
+SELECT id, school_name, program_name, degree_type
+FROM programs 
+WHERE school_name = $1
+ORDER BY program_name
+"""
+# Program details and its courses in one round-trip, program is NULL if it doesn't exist
+PROGRAM_COURSES_QUERY = """
+SELECT
+    (SELECT to_jsonb(p) FROM (SELECT program_name, school_name FROM programs WHERE id = $1) p) AS program,
+    COALESCE((
+        SELECT jsonb_agg(c ORDER BY c.code)
+        FROM (
+            SELECT id, program_id, code, title, credits, offered_terms, prerequisites
+            FROM courses 
+            WHERE program_id = $1
+        ) c
+    ), '[]'::jsonb) AS courses
+"""
+USERS_QUERY = "SELECT id, email, name FROM users ORDER BY name"
+USER_QUERY = "SELECT id, email, name FROM users WHERE id = $1"
+TABLES_QUERY = """
+SELECT table_name 
+FROM information_schema.tables 
+WHERE table_schema = 'public' 
+ORDER BY table_name
+"""
+
+# Catalog data (schools, programs, courses) rarely changes, so cache it for a few minutes
+CATALOG_CACHE_TTL = 300
+CATALOG_CACHE_NAMESPACE = "catalog"
+CATALOG_CACHE_MAX_ENTRIES = 1000  # Every distinct URL is its own entry, so keep the cache bounded
+
+# Token required by the /admin endpoints (sent as the X-Admin-Token header), admin endpoints are off when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
-class Course(BaseModel):
+class BoundedInMemoryBackend(InMemoryBackend):
     """
-    Model for course data
+    InMemoryBackend with a size limit.
+    The stock backend only drops an expired entry when it is read again, so made-up URLs
+    (like /schools/<anything>/programs) would pile up forever. When the cache is full,
+    expired entries are removed first, then the oldest ones
     """
-    id: int
-    program_id: int
-    code: str
-    title: str
-    credits: int
-    offered_terms: List[str]      # List of strings like ["Fall", "Spring"]
-    prerequisites: List[str]      # List of course codes
-
-# To connect to database, create and return a connection to PostgreSQL DB and can be paused or resumed bc of async
-async def get_database_connection():
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        async with self._lock:
+            if key not in self._store and len(self._store) >= self.max_entries:
+                now = self._now
+                for expired_key in [k for k, v in self._store.items() if v.ttl_ts < now]:
+                    del self._store[expired_key]
+                # Dicts keep insertion order, so the first keys are the oldest
+                while len(self._store) >= self.max_entries:
+                    del self._store[next(iter(self._store))]
+            self._store[key] = Value(value, self._now + (expire or 0))
+
+# Build cache keys from the URL only, the pooled connection passed to the endpoint must not be part of the key
+def catalog_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    # namespace already comes with the FastAPICache prefix, which is what clear() matches on
+    return f"{namespace}:{request.url.path}"
+
+# Connection pool settings, one pool per worker process shared by every request
+POOL_MAX_SIZE = max(1, DB_MAX_CONNECTIONS // WEB_CONCURRENCY)
+POOL_MIN_SIZE = min(10, POOL_MAX_SIZE)
+# Prepared statements kept per connection. PgBouncer in transaction mode hands each
+# transaction a different server connection, so cached prepared statements must be off there
+STATEMENT_CACHE_SIZE = 0 if DB_PGBOUNCER else 1024
+POOL_ACQUIRE_TIMEOUT = 2.0   # Seconds to wait for a free connection before giving up
+CONNECT_TIMEOUT = 10         # Seconds to wait when opening a new connection
+
+# Threads available for any sync (def) code FastAPI has to run outside the event loop
+THREADPOOL_SIZE = 100
+
+# Runs once for every new connection the pool opens
+async def _init_conn(conn):
+    # Let asyncpg convert JSONB columns to/from Python objects so endpoints don't have to.
+    # Binary JSONB is a version byte (1) followed by the JSON text
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=lambda value: b'\x01' + orjson.dumps(value),
+        decoder=lambda data: orjson.loads(data[1:]),
+        schema='pg_catalog',
+        format='binary',
+    )
+    await conn.execute('SELECT 1')
+
+# Open the connection pool once when the app starts instead of connecting on every request
+@app.on_event("startup")
+async def open_database_pool():
+    logger.info("Connecting to database: %s:%s/%s as %s", DB_HOST, DB_PORT, DB_NAME, DB_USER)
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    # create_pool opens min_size connections (running _init_conn on each) before returning,
+    # so the pool is already warm when the first request comes in
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=300,  # Recycle idle connections after 5 minutes
+        command_timeout=60,
+        timeout=CONNECT_TIMEOUT,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        init=_init_conn,
+    )
+
+
+    app.state.pool = pool
+
+    FastAPICache.init(BoundedInMemoryBackend(CATALOG_CACHE_MAX_ENTRIES))
+
+# Close every pooled connection when the app shuts down
+@app.on_event("shutdown")
+async def close_database_pool():
+    await app.state.pool.close()
+
+# Borrow a connection from the pool (waiting at most POOL_ACQUIRE_TIMEOUT) and give it back when done
+@asynccontextmanager
+async def acquire_conn(pool):
     try:
-        connection = await asyncpg.connect(DATABASE_URL)
-        return connection
+        connection = await pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Every connection is busy, fail fast instead of letting requests pile up
+        raise HTTPException(status_code=503, detail="DB pool saturated")
     except asyncpg.InvalidPasswordError:
-        print("ERROR: Invalid database password")
+        logger.error("Invalid database password")
         raise HTTPException(status_code=500, detail="Database authentication failed")
     except asyncpg.InvalidCatalogNameError:
-        print(f"ERROR: Database '{DB_NAME}' does not exist")
+        logger.error("Database '%s' does not exist", DB_NAME)
         raise HTTPException(status_code=500, detail=f"Database '{DB_NAME}' not found")
     except asyncpg.ConnectionDoesNotExistError:
-        print(f"ERROR: Cannot connect to database server at {DB_HOST}:{DB_PORT}")
+        logger.error("Cannot connect to database server at %s:%s", DB_HOST, DB_PORT)
         raise HTTPException(status_code=500, detail="Database server not reachable")
-    except Exception as e:
-        print(f"ERROR: Database connection failed: {e}")
+    except Exception:
+        logger.exception("Database connection failed")
         raise HTTPException(status_code=500, detail="Database connection failed")
+
+    try:
+        yield connection
+    finally:
+        # Return connection to the pool
+        await pool.release(connection)
+
+# Dependency that hands a pooled connection to the endpoint for the whole request
+async def get_conn(request: Request):
+    async with acquire_conn(request.app.state.pool) as connection:
+        yield connection
     
+# Columns expected (in this order) in every row passed to bulk_insert_courses
+COURSE_COLUMNS = ["program_id", "code", "title", "credits", "offered_terms", "prerequisites"]
+
+INSERT_COURSE_QUERY = """
+INSERT INTO courses (program_id, code, title, credits, offered_terms, prerequisites)
+VALUES ($1, $2, $3, $4, $5, $6)
+"""
+
+# Insert many courses at once (e.g. when seeding a program), rows are tuples in COURSE_COLUMNS order.
+# Pass clear_cache=True when calling this from inside the running API. A separate script has no
+# catalog cache of its own, so after running one call POST /admin/cache/clear or restart the API
+async def bulk_insert_courses(pool, rows, use_copy=True, clear_cache=False):
+    async with pool.acquire() as conn:
+        if use_copy:
+            # COPY is the fastest way to load rows into PostgreSQL
+            await conn.copy_records_to_table('courses', records=rows, columns=COURSE_COLUMNS)
+        else:
+            # executemany batches every row into one round-trip, much faster than a loop of execute()
+            await conn.executemany(INSERT_COURSE_QUERY, rows)
+    
+    if clear_cache:
+        # Cached course lists are now out of date (clears this worker's cache, see clear_catalog_cache)
+        await FastAPICache.clear(namespace=CATALOG_CACHE_NAMESPACE)
+
 # Basic route 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Degree Planner API", "status": "running"}  # Just to verify that API is working 
 
+# Configuration never changes after startup, so build the /config response once
+_ENV_FILE_LOADED = os.path.exists(".env")
+
+CONFIG_STATUS = {
+    "database": {
+        "host": DB_HOST,
+        "port": DB_PORT, 
+        "name": DB_NAME,
+        "user": DB_USER,
+        "password_set": bool(DB_PASSWORD),  # Show if password exists, not the actual password
+    },
+    "environment_file_loaded": _ENV_FILE_LOADED,
+    "status": "OK" if DB_USER and DB_PASSWORD else "MISSING_CREDENTIALS"
+}
+
+if not DB_USER or not DB_PASSWORD:
+    CONFIG_STATUS["error"] = "DB_USER or DB_PASSWORD not set in environment"
+
 # Configuration check endpoint
 @app.get("/config")
-def check_config():
+async def check_config():
     """
     Check if environment variables are properly configured to debug
     """
-    config_status = {
-        "database": {
-            "host": DB_HOST,
-            "port": DB_PORT, 
-            "name": DB_NAME,
-            "user": DB_USER,
-            "password_set": bool(DB_PASSWORD),  # Show if password exists, not the actual password
-        },
-        "environment_file_loaded": os.path.exists(".env"),
-        "status": "OK" if DB_USER and DB_PASSWORD else "MISSING_CREDENTIALS"
-    }
-    
-    if not DB_USER or not DB_PASSWORD:
-        config_status["error"] = "DB_USER or DB_PASSWORD not set in environment"
-    
-    return config_status
+    return CONFIG_STATUS
+
+# Helpers for /test-db, each one borrows its own connection (with the usual acquire timeout)
+# so they can run in parallel
+async def _fetch_database_name(pool):
+    async with acquire_conn(pool) as conn:
+        return await conn.fetchval("SELECT current_database()")
+
+async def _fetch_tables(pool):
+    async with acquire_conn(pool) as conn:
+        return await conn.fetch(TABLES_QUERY)
+
+# Try to count programs, None if the table hasn't been created yet
+async def _count_programs(pool):
+    async with acquire_conn(pool) as conn:
+        try:
+            return await conn.fetchval("SELECT COUNT(*) FROM programs")
+        except asyncpg.UndefinedTableError:
+            return None
 
 # Test DB connection 
 @app.get("/test-db")
-async def test_database():
+async def test_database(request: Request):
     try:
-        # Connect to database
-        conn = await get_database_connection()
-        
-        # See what database is connected to
-        db_name = await conn.fetchval("SELECT current_database()")
-        
-        # Check if tables exist
-        tables_query = """
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema = 'public' 
-        ORDER BY table_name
-        """
-        tables = await conn.fetch(tables_query)
+        pool = request.app.state.pool
+        
+        # The three queries are independent, so run them in parallel.
+        # Each helper borrows its own connection, a single connection can't be shared here
+        db_name, tables, programs_count = await asyncio.gather(
+            _fetch_database_name(pool),  # See what database is connected to
+            _fetch_tables(pool),  # Check if tables exist
+            _count_programs(pool),
+        )
         table_names = [row['table_name'] for row in tables]
         
-        # Try to count programs
-        programs_count = None
-        if 'programs' in table_names:
-            programs_count = await conn.fetchval("SELECT COUNT(*) FROM programs")
-        
-        # Close connection 
-        await conn.close()
-        
         return {
             "status": "success", 
             "message": "Database connection working!",
@@ -175,71 +378,65 @@ async def test_database():
     
 # Get all schools from DB
 @app.get("/schools")
-async def get_all_schools():
-    conn = await get_database_connection()
-    
-    try:
-        # SQL query to get unique school names, sorted alphabetically
-        query = "SELECT DISTINCT school_name FROM programs ORDER BY school_name"
-        
-        rows = await conn.fetch(query)
-        
-        # Convert database rows to a simple list
-        # Each row is like a dictionary with the school_name value
-        schools = [row['school_name'] for row in rows]
-        
-        return {"schools": schools, "count": len(schools)}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        # Close connection 
-        await conn.close()
+@cache(expire=CATALOG_CACHE_TTL, namespace=CATALOG_CACHE_NAMESPACE, key_builder=catalog_key_builder)
+async def get_all_schools(request: Request):
+    # Only borrow a connection on a cache miss, cache hits are answered before this runs
+    async with acquire_conn(request.app.state.pool) as conn:
+        try:
+            # Get unique school names, sorted alphabetically
+            rows = await conn.fetch(SCHOOLS_QUERY)
+        
+            # Convert database rows to a simple list
+            # Each row is like a dictionary with the school_name value
+            schools = [row['school_name'] for row in rows]
+        
+            return {"schools": schools, "count": len(schools)}
+        
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 # Get programs for a specific school
 @app.get("/schools/{school_name}/programs")
-async def get_programs_for_school(school_name: str):
-
-    conn = await get_database_connection()
-    
-    try:
-        # SQL query with a parameter ($1 is a placeholder for school_name)
-        query = """
-        SELECT id, school_name, program_name, degree_type
-        FROM programs 
-        WHERE school_name = $1
-        ORDER BY program_name
-        """
-        
-        # Pass school_name as parameter, prevents SQL injection attacks
-        rows = await conn.fetch(query, school_name)
-        
-        # Convert each row to a dictionary
-        programs = [dict(row) for row in rows]
-        
-        return {
-            "school": school_name,
-            "programs": programs,
-            "count": len(programs)
-        }
+@cache(expire=CATALOG_CACHE_TTL, namespace=CATALOG_CACHE_NAMESPACE, key_builder=catalog_key_builder)
+async def get_programs_for_school(school_name: str, request: Request):
+    # Only borrow a connection on a cache miss, cache hits are answered before this runs
+    async with acquire_conn(request.app.state.pool) as conn:
+        try:
+            # Pass school_name as parameter ($1), prevents SQL injection attacks
+            rows = await conn.fetch(PROGRAMS_FOR_SCHOOL_QUERY, school_name)
+        
+            # Return plain data (not a Response) so the cache can add its headers,
+            # converting rows only happens on a cache miss
+            programs = [dict(row) for row in rows]
+            
+            return {
+                "school": school_name,
+                "programs": programs,
+                "count": len(programs)
+            }
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+# Drop cached catalog data, call this after changing schools, programs or courses in the DB.
+# The cache lives in each worker's memory, so this only clears the worker that handles the request,
+# the others catch up when their entries expire (CATALOG_CACHE_TTL). Restart the API to clear all of them
+@app.post("/admin/cache/clear")
+async def clear_catalog_cache(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token missing or invalid")
     
-    finally:
-        await conn.close()  # Close it 
+    await FastAPICache.clear(namespace=CATALOG_CACHE_NAMESPACE)
+    return {"message": "Catalog cache cleared"}
 
 # Create a user
 @app.post("/users")
-async def create_new_user(user_data: CreateUser):
+async def create_new_user(user_data: CreateUser, conn: asyncpg.Connection = Depends(get_conn)):
     """
     Create a new user
     user_data will be automatically validated by Pydantic
     If the JSON doesn't match CreateUser model, FastAPI returns error automatically
     """
-    conn = await get_database_connection()
-    
     try:
         query = """
         INSERT INTO users (email, name)
@@ -250,49 +447,43 @@ async def create_new_user(user_data: CreateUser):
         # Insert the new user and return the created user data
         row = await conn.fetchrow(query, user_data.email, user_data.name)
         
-        return {
+        return RecordJSONResponse({
             "message": "User created successfully",
-            "user": dict(row)
-        }
+            "user": row
+        })
         
     except asyncpg.UniqueViolationError:
         # This happens if email already exists (because email is UNIQUE in our table)
         raise HTTPException(status_code=400, detail="Email already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
 
 # Save a degree plan
 @app.post("/users/{user_id}/plans")
-async def save_degree_plan(user_id: int, plan_data: CreatePlan):
+async def save_degree_plan(user_id: Annotated[int, Path(ge=INT4_MIN, le=INT4_MAX)], plan_data: CreatePlan, conn: asyncpg.Connection = Depends(get_conn)):
     """
     Save a degree plan for a user
     This combines path parameter (user_id) with POST data (plan_data)
     """
-    conn = await get_database_connection()
-    
     try:
-        # First verify user exists
-        user_check = await conn.fetchval("SELECT id FROM users WHERE id = $1", user_id)
-        if not user_check:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Verify program exists  
-        program_check = await conn.fetchval("SELECT id FROM programs WHERE id = $1", plan_data.program_id)
-        if not program_check:
-            raise HTTPException(status_code=404, detail="Program not found")
-        
-        # Save the plan
+        # Check the user and program exist and save the plan in a single round-trip
         query = """
+        WITH u AS (SELECT id FROM users WHERE id = $1),
+             p AS (SELECT id FROM programs WHERE id = $2)
         INSERT INTO plans (user_id, program_id, plan_data)
-        VALUES ($1, $2, $3)
+        SELECT u.id, p.id, $3::jsonb FROM u, p
         RETURNING id, created_at
         """
         
-        # Convert plan_data.plan_data (dict) to JSON string for database storage
-        result = await conn.fetchrow(query, user_id, plan_data.program_id, json.dumps(plan_data.plan_data))
+        # plan_data.plan_data (dict) is encoded to JSONB by the connection codec
+        result = await conn.fetchrow(query, user_id, plan_data.program_id, plan_data.plan_data)
+        
+        if not result:
+            # Nothing was inserted, find out which one is missing
+            user_check = await conn.fetchval("SELECT id FROM users WHERE id = $1", user_id)
+            if not user_check:
+                raise HTTPException(status_code=404, detail="User not found")
+            raise HTTPException(status_code=404, detail="Program not found")
         
         return {
             "message": "Plan saved successfully",
@@ -302,44 +493,41 @@ async def save_degree_plan(user_id: int, plan_data: CreatePlan):
         
     except HTTPException:
         raise
+    except ValueError as e:
+        # asyncpg raises a ValueError (DataError) when it can't encode a query argument. The ids
+        # are bounded to INTEGER above, so this is plan_data, e.g. integers bigger than 64 bits
+        # which orjson doesn't support
+        raise HTTPException(status_code=422, detail=f"Invalid plan_data: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
 
 # Get all plans for a user
 @app.get("/users/{user_id}/plans")
-async def get_user_plans(user_id: int):
+async def get_user_plans(user_id: int, conn: asyncpg.Connection = Depends(get_conn)):
     """Get all saved plans for a specific user"""
-    conn = await get_database_connection()
-    
     try:
-        # Join plans with programs to get program details
+        # Join plans with programs to get program details and let Postgres
+        # build the whole list as one JSONB array (newest plan first)
         query = """
-        SELECT 
-            p.id, 
-            p.user_id, 
-            p.program_id, 
-            p.plan_data, 
-            p.created_at,
-            pr.school_name, 
-            pr.program_name, 
-            pr.degree_type
-        FROM plans p
-        JOIN programs pr ON p.program_id = pr.id
-        WHERE p.user_id = $1
-        ORDER BY p.created_at DESC
+        SELECT COALESCE(jsonb_agg(row_to_json(t) ORDER BY t.created_at DESC), '[]'::jsonb)
+        FROM (
+            SELECT 
+                p.id, 
+                p.user_id, 
+                p.program_id, 
+                p.plan_data, 
+                p.created_at,
+                pr.school_name, 
+                pr.program_name, 
+                pr.degree_type
+            FROM plans p
+            JOIN programs pr ON p.program_id = pr.id
+            WHERE p.user_id = $1
+        ) t
         """
         
-        rows = await conn.fetch(query, user_id)
-        
-        plans = []
-        for row in rows:
-            plan = dict(row)
-            # Convert JSON string back to dict
-            plan['plan_data'] = json.loads(plan['plan_data'])
-            plans.append(plan)
+        # The JSONB codec turns the array straight into a list of dicts
+        plans = await conn.fetchval(query, user_id)
         
         return {
             "user_id": user_id,
@@ -349,94 +537,76 @@ async def get_user_plans(user_id: int):
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
 
 # Get courses for a specific program
 @app.get("/programs/{program_id}/courses")
-async def get_courses_for_program(program_id: int):
+@cache(expire=CATALOG_CACHE_TTL, namespace=CATALOG_CACHE_NAMESPACE, key_builder=catalog_key_builder)
+async def get_courses_for_program(program_id: int, request: Request):
     """
     Get all courses for a specific program
     program_id is converted to integer automatically by FastAPI
     """
-    conn = await get_database_connection()
-    
-    try:
-        # Verify the program exists
-        program_query = "SELECT program_name, school_name FROM programs WHERE id = $1"
-        program = await conn.fetchrow(program_query, program_id)
-        
-        if not program:
-            # If program doesn't exist, return 404 error
-            raise HTTPException(status_code=404, detail=f"Program with id {program_id} not found")
-        
-        # Get all courses for this program
-        courses_query = """
-        SELECT id, program_id, code, title, credits, offered_terms, prerequisites
-        FROM courses 
-        WHERE program_id = $1
-        ORDER BY code
-        """
-        
-        rows = await conn.fetch(courses_query, program_id)
-        courses = [dict(row) for row in rows]
-        
-        return {
-            "program_id": program_id,
-            "program_name": program['program_name'],
-            "school_name": program['school_name'],
-            "courses": courses,
-            "total_courses": len(courses)
-        }
+    # Only borrow a connection on a cache miss, cache hits are answered before this runs
+    async with acquire_conn(request.app.state.pool) as conn:
+        try:
+            # Get the program and all of its courses at once (both decoded by the JSONB codec)
+            row = await conn.fetchrow(PROGRAM_COURSES_QUERY, program_id)
+            program = row['program']
+        
+            if program is None:
+                # If program doesn't exist, return 404 error
+                raise HTTPException(status_code=404, detail=f"Program with id {program_id} not found")
+        
+            courses = row['courses']
+        
+            # Return plain data (not a Response) so the cache can add its headers
+            return {
+                "program_id": program_id,
+                "program_name": program['program_name'],
+                "school_name": program['school_name'],
+                "courses": courses,
+                "total_courses": len(courses)
+            }
         
-    except HTTPException:
-        # Re-raise HTTPException (like 404) without changing it
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
+        except HTTPException:
+            # Re-raise HTTPException (like 404) without changing it
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 # Get all users
 @app.get("/users")
-async def get_all_users():
+async def get_all_users(conn: asyncpg.Connection = Depends(get_conn)):
     """Get all users in the system"""
-    conn = await get_database_connection()
-    
     try:
-        query = "SELECT id, email, name FROM users ORDER BY name"
-        rows = await conn.fetch(query)
-        users = [dict(row) for row in rows]
+        rows = await conn.fetch(USERS_QUERY)
         
-        return {"users": users, "count": len(users)}
+        return RecordJSONResponse({"users": rows, "count": len(rows)})
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
 
 # Get specific user
 @app.get("/users/{user_id}")
-async def get_user(user_id: int):
+async def get_user(user_id: int, conn: asyncpg.Connection = Depends(get_conn)):
     """Get a specific user by their ID"""
-    conn = await get_database_connection()
-    
     try:
-        query = "SELECT id, email, name FROM users WHERE id = $1"
-        row = await conn.fetchrow(query, user_id)
+        row = await conn.fetchrow(USER_QUERY, user_id)
         
         if not row:
             raise HTTPException(status_code=404, detail=f"User with id {user_id} not found")
         
-        return dict(row)
+        return RecordJSONResponse(row)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    
-    finally:
-        await conn.close()
\ No newline at end of file
+
+# Run the API directly with `python main.py`
+if __name__ == "__main__":
+    import uvicorn
+    # "auto" picks uvloop whenever it's installed (it isn't on Windows), uvloop + httptools
+    # are much faster than the plain asyncio loop and h11 parser.
+    # Set WEB_CONCURRENCY to the number of workers (e.g. `nproc`) so the DB pool is sized to match
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, loop="auto", http="httptools", workers=WEB_CONCURRENCY)
@@ -0,0 +1,107 @@
+# One-off database migrations. Run this once before starting the API (and again after upgrading):
+#
+#     python migrate.py
+#
+# The API relies on plans.plan_data being JSONB (its connection codec only handles jsonb),
+# so this has to be done before the new server code talks to an older database.
+# It also creates the indexes the hot queries use. Every step is safe to run again.
+# Run it as a role that owns the tables.
+#
+# The migration needs a direct connection to PostgreSQL: it holds a session-level advisory lock,
+# which doesn't work through PgBouncer in transaction mode. When the API runs behind PgBouncer
+# (DB_PGBOUNCER=true), set MIGRATION_DATABASE_URL to the real PostgreSQL server.
+
+import asyncio
+import os   # os for environment var
+import sys
+import asyncpg   # For PostgreSQL connection
+from main import DATABASE_URL, DB_PGBOUNCER
+
+# Any fixed number works, it just has to be the same for every copy of this script
+MIGRATION_LOCK_ID = 640_231_001
+
+# Older databases created plans.plan_data as TEXT/JSON, convert it to JSONB
+async def migrate_plan_data_column(conn):
+    column_type = await conn.fetchval("""
+        SELECT data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'plans' AND column_name = 'plan_data'
+    """)
+    if not column_type or column_type == 'jsonb':
+        return
+
+    print(f"Converting plans.plan_data from {column_type} to jsonb")
+    try:
+        # Rewrites the table under an exclusive lock, so run this while the API is quiet
+        await conn.execute("ALTER TABLE plans ALTER COLUMN plan_data TYPE jsonb USING plan_data::jsonb")
+    except asyncpg.InvalidTextRepresentationError as e:
+        raise SystemExit(f"ERROR: plans.plan_data has rows that aren't valid JSON, fix them first ({e})")
+    except asyncpg.InsufficientPrivilegeError as e:
+        raise SystemExit(f"ERROR: Run the migration as the owner of the plans table ({e})")
+
+# Indexes backing the API's hot queries. INCLUDE columns let Postgres answer from the index alone.
+# users.email needs nothing extra, its UNIQUE constraint already comes with an index.
+# plan_data is left out of the plans index, big plans would go over the index row size limit
+INDEXES = {
+    "programs_school_name_idx":
+        "ON programs (school_name) INCLUDE (program_name, degree_type, id)",
+    "courses_program_id_idx":
+        "ON courses (program_id) INCLUDE (code, title, credits, offered_terms, prerequisites)",
+    "plans_user_id_created_at_idx":
+        "ON plans (user_id, created_at DESC) INCLUDE (program_id)",
+}
+
+# Build the indexes without blocking writes. CONCURRENTLY can't run inside a transaction,
+# so each index is its own statement
+async def create_indexes(conn):
+    for name, definition in INDEXES.items():
+        # A failed or interrupted CONCURRENTLY build leaves an INVALID index behind. IF NOT EXISTS
+        # would skip it forever while Postgres keeps updating it, so drop it and build it again
+        is_valid = await conn.fetchval("""
+            SELECT i.indisvalid
+            FROM pg_index i
+            WHERE i.indexrelid = to_regclass($1)
+        """, f"public.{name}")
+        if is_valid is False:
+            print(f"Rebuilding invalid index {name}")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        elif is_valid:
+            continue
+
+        print(f"Creating index {name}")
+        await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+# Where to run the migration, skipping PgBouncer
+def get_migration_database_url():
+    migration_url = os.getenv("MIGRATION_DATABASE_URL")
+    if migration_url:
+        return migration_url
+    if DB_PGBOUNCER:
+        raise SystemExit("ERROR: DB_PGBOUNCER is set, point MIGRATION_DATABASE_URL at PostgreSQL directly (not PgBouncer)")
+    return DATABASE_URL
+
+async def main():
+    database_url = get_migration_database_url()
+    # No command timeout, a table rewrite or index build can take a while on big tables
+    conn = await asyncpg.connect(database_url, command_timeout=None)
+    try:
+        # Only one copy of the migration runs at a time. Don't wait for the lock: a waiting
+        # session holds a snapshot that CREATE INDEX CONCURRENTLY would wait on, and Postgres
+        # would abort one side with a deadlock
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+            print("Another migration is already running, nothing to do")
+            return
+        try:
+            await migrate_plan_data_column(conn)
+            await create_indexes(conn)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+    except asyncpg.PostgresError as e:
+        print(f"ERROR: Migration failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        await conn.close()
+    print("Migrations done")
+
+if __name__ == "__main__":
+    asyncio.run(main())